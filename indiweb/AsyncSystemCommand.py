@@ -4,61 +4,67 @@ import subprocess
 import threading
 import logging
 
+# Seconds to wait for the process group to exit after SIGTERM
+TERMINATE_TIMEOUT = 5
+
 class AsyncSystemCommand:
-	def __init__(self, command):
+	def __init__(self, command, logfile=None):
 		self.command = command
+		self.logfile = logfile
+		# Argument lists are executed directly, strings go through the shell
+		self.shell = isinstance(command, str)
 		self.process = None
-		self.output = None
 		self.error = None
 		self.finished = False
 		self.lock = threading.Lock()
 
-	def _process_output(self, stream, capture):
-		for line in stream:
-			line = line.decode('utf-8').strip()
-			with self.lock:
-				if capture:
-					self.output += line + '\n'
-				logging.info(line)
+	def start(self):
+		"""Launch the command and return without waiting for it.
 
-	def run(self):
+		Output goes to logfile (or is discarded) so no thread is needed to
+		drain the pipes, is_running() polls the process instead.
+		"""
 		self.finished = False
-		self.output = ''
 		try:
-			self.process = subprocess.Popen(
-				self.command,
-				stdout=subprocess.PIPE,
-				stderr=subprocess.PIPE,
-				shell=True,
-				preexec_fn=os.setsid
-			)
-			logging.info(f"PID OF RUNNING CMD IS {os.getpgid(self.process.pid)}")
-			stdout_thread = threading.Thread(target=self._process_output, args=(self.process.stdout, False))
-			stderr_thread = threading.Thread(target=self._process_output, args=(self.process.stderr, False))
-
-			stdout_thread.start()
-			stderr_thread.start()
-
-			self.process.wait()
-			stdout_thread.join()
-			stderr_thread.join()
-
+			if self.logfile:
+				with open(self.logfile, 'wb') as log:
+					self.process = subprocess.Popen(
+						self.command,
+						stdout=log,
+						stderr=subprocess.STDOUT,
+						shell=self.shell,
+						preexec_fn=os.setsid
+					)
+			else:
+				self.process = subprocess.Popen(
+					self.command,
+					stdout=subprocess.DEVNULL,
+					stderr=subprocess.DEVNULL,
+					shell=self.shell,
+					preexec_fn=os.setsid
+				)
+			logging.info("PID OF RUNNING CMD IS %s", os.getpgid(self.process.pid))
 		except Exception as e:
-			logging.info(f"RUN ERROR {e}")
+			logging.info("RUN ERROR %s", e)
 			with self.lock:
 				self.error = str(e)
 				self.finished = True
-		finally:
-			logging.info(f"RUN of {self.command} IS FINISHED with output {self.output}")
-			with self.lock:
-				self.finished = True
 
 	def is_running(self):
 		with self.lock:
+			if not self.finished and self.process and self.process.poll() is not None:
+				self.finished = True
 			return not self.finished
 
 	def terminate(self):
 		if self.process and not self.finished:
-			os.killpg(os.getpgid(self.process.pid), signal.SIGTERM)
+			pgid = os.getpgid(self.process.pid)
+			os.killpg(pgid, signal.SIGTERM)
+			try:
+				self.process.wait(timeout=TERMINATE_TIMEOUT)
+			except subprocess.TimeoutExpired:
+				logging.warning("PROCESS GROUP %s IGNORED SIGTERM, KILLING IT", pgid)
+				os.killpg(pgid, signal.SIGKILL)
+				self.process.wait()
 			with self.lock:
 				self.finished = True
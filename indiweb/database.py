@@ -2,8 +2,17 @@ import os
 import errno
 import sqlite3
 import logging
+import threading
 from . import __version__
 
+# SQLite settings applied to every connection. WAL lets readers proceed
+# while a profile is being written.
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+}
+
 
 def dict_factory(cursor, row):
     d = {}
@@ -13,7 +22,7 @@ def dict_factory(cursor, row):
 
 
 class Database(object):
-    def __init__(self, filename):
+    def __init__(self, filename, pragmas=None):
         # create the directory if it does not exist
         db_dir = os.path.dirname(filename)
         try:
@@ -22,10 +31,18 @@ class Database(object):
             if e.errno != errno.EEXIST:
                 raise
         else:
-            logging.info("Created directory %s" % db_dir)
+            logging.info("Created directory %s", db_dir)
 
         self.__conn = sqlite3.connect(filename, check_same_thread=False)
         self.__conn.row_factory = dict_factory
+        settings = dict(DEFAULT_PRAGMAS)
+        settings.update(pragmas or {})
+        for key, value in settings.items():
+            self.__conn.execute('PRAGMA %s=%s' % (key, value))
+        # Profile rows, reloaded after any profile write. The lock keeps a
+        # read that started before a write from storing rows it cleared.
+        self.__profiles = None
+        self.__profiles_lock = threading.Lock()
 
         # update table for version and any schema updates
         self.update()
@@ -92,18 +109,25 @@ class Database(object):
             self.__conn.commit()
         c.close()
 
-    def get_autoprofile(self):
-        """Get auto start profile"""
+    def get_autostart_profile(self):
+        """Get the first profile flagged for auto start, if any"""
 
-        cursor = self.__conn.execute('SELECT profile FROM autostart')
-        result = cursor.fetchone()
-        return result['profile'] if result else ''
+        cursor = self.__conn.execute(
+            'SELECT * FROM profile WHERE autostart=1 ORDER BY id LIMIT 1')
+        return cursor.fetchone()
 
     def get_profiles(self):
         """Get all profiles from database"""
 
-        cursor = self.__conn.execute('SELECT * FROM profile')
-        return cursor.fetchall()
+        with self.__profiles_lock:
+            if self.__profiles is None:
+                cursor = self.__conn.execute('SELECT * FROM profile')
+                self.__profiles = cursor.fetchall()
+            return self.__profiles
+
+    def __clear_profiles(self):
+        with self.__profiles_lock:
+            self.__profiles = None
 
     def get_custom_drivers(self):
         """Get all custom drivers from database"""
@@ -127,6 +151,24 @@ class Database(object):
             'WHERE profile=(SELECT id FROM profile WHERE name=?)', (name,))
         return cursor.fetchone()
 
+    def get_profile_all_drivers(self, name):
+        """Get local driver labels and remote drivers of a profile at once"""
+
+        cursor = self.__conn.execute(
+            'SELECT label, 0 AS remote FROM driver '
+            'WHERE profile=(SELECT id FROM profile WHERE name=?) '
+            'UNION ALL '
+            'SELECT drivers, 1 FROM remote '
+            'WHERE profile=(SELECT id FROM profile WHERE name=?)', (name, name))
+        labels = []
+        remote = None
+        for row in cursor:
+            if not row['remote']:
+                labels.append(row['label'])
+            elif remote is None:
+                remote = row['label']
+        return labels, remote
+
     def delete_profile(self, name):
         """Delete Profile"""
 
@@ -135,6 +177,7 @@ class Database(object):
                   '(SELECT id FROM profile WHERE name=?)', (name,))
         c.execute('DELETE FROM profile WHERE name=?', (name,))
         self.__conn.commit()
+        self.__clear_profiles()
         c.close()
 
     def add_profile(self, name):
@@ -144,6 +187,7 @@ class Database(object):
         try:
             c.execute('INSERT INTO profile (name) VALUES(?)', (name,))
             self.__conn.commit()
+            self.__clear_profiles()
         except sqlite3.IntegrityError:
             logging.warning("Profile name %s already exists.", name)
         return c.lastrowid
@@ -151,9 +195,11 @@ class Database(object):
     def get_profile(self, name):
         """Get profile info"""
 
-        cursor = self.__conn.execute('SELECT * FROM profile WHERE name=?',
-                                     (name,))
-        return cursor.fetchone()
+        # Served from the cached profile rows, there are only a handful
+        for profile in self.get_profiles():
+            if profile['name'] == name:
+                return profile
+        return None
 
     def update_profile(self, name, port, autostart=False, autoconnect=False):
         """Update profile info"""
@@ -165,6 +211,7 @@ class Database(object):
         c.execute('UPDATE profile SET port=?, autostart=?, autoconnect=? WHERE name=?',
                   (port, autostart, autoconnect, name))
         self.__conn.commit()
+        self.__clear_profiles()
         c.close()
 
     def save_profile_drivers(self, name, drivers):
@@ -28,6 +28,7 @@ class DriverCollection:
         self.path = path
         self.drivers = []
         self.files = []
+        self.__label_index = None
         self.parse_drivers()
 
     def parse_drivers(self):
@@ -58,28 +59,35 @@ class DriverCollection:
                         self.drivers.append(driver)
 
             except KeyError as e:
-                logging.error("Error in file %s: attribute %s not found" % (fname, e))
+                logging.error("Error in file %s: attribute %s not found", fname, e)
             except ET.ParseError as e:
-                logging.error("Error in file %s: %s" % (fname, e))
+                logging.error("Error in file %s: %s", fname, e)
 
         # Sort all drivers by label
         self.drivers.sort(key=lambda x: x.label)
+        self.__label_index = None
 
     def parse_custom_drivers(self, drivers):
         for custom in drivers:
             driver = DeviceDriver(custom['name'], custom['label'], custom['version'], custom['exec'],
                                   custom['family'], None, True)
             self.drivers.append(driver)
+        self.__label_index = None
 
     def clear_custom_drivers(self):
         self.drivers = list(filter(lambda driver: driver.custom is not True, self.drivers))
+        self.__label_index = None
 
     def by_label(self, label):
-        for driver in self.drivers:
-            if (driver.label == label):
-                return driver
-
-        return None
+        # Index is rebuilt lazily after the driver list changes
+        if self.__label_index is None:
+            index = {}
+            for driver in self.drivers:
+                # Keep the first driver for duplicated labels
+                index.setdefault(driver.label, driver)
+            self.__label_index = index
+
+        return self.__label_index.get(label)
 
     def by_name(self, name):
         for driver in self.drivers:
@@ -1,18 +1,20 @@
 #!/usr/bin/python
+import errno
 import logging
 import os
+import time
 from subprocess import call, check_output
-import threading
 
 # Local imports
 from .AsyncSystemCommand import AsyncSystemCommand
 
 INDI_PORT = 7624
 INDI_FIFO = '/tmp/indiFIFO'
-try:
-    INDI_CONFIG_DIR = os.path.join(os.environ['HOME'], '.indi')
-except KeyError:
-    INDI_CONFIG_DIR = '/tmp/indi'
+INDI_LOG = '/tmp/indiserver.log'
+_home = os.environ.get('HOME')
+INDI_CONFIG_DIR = os.path.join(_home, '.indi') if _home else '/tmp/indi'
+# Seconds to wait for indiserver to open its end of the FIFO
+INDI_FIFO_TIMEOUT = 10
 
 class IndiServer(object):
     def __init__(self, fifo=INDI_FIFO, conf_dir=INDI_CONFIG_DIR):
@@ -20,67 +22,109 @@ class IndiServer(object):
         self.__sock_path = f"{self.__fifo}_sock"
         self.__conf_dir = conf_dir
         self.__async_cmd = None
-        self.__command_thread = None
+        self.__running_drivers = {}
+        self.__fifo_fd = None
 
     def __clear_fifo(self):
-        logging.info("Deleting fifo %s" % self.__fifo)
-        call(['rm', '-f', self.__fifo])
-        call(['mkfifo', self.__fifo])
+        # A fresh FIFO per server, so a reader left over from a previous
+        # indiserver cannot receive the commands meant for the new one
+        logging.info("Deleting fifo %s", self.__fifo)
+        try:
+            os.unlink(self.__fifo)
+        except FileNotFoundError:
+            pass
+        os.mkfifo(self.__fifo, 0o600)
 
     def __run(self, port):
-        cmd = 'indiserver -p %d -m 1000 -v -f %s -u %s > /tmp/indiserver.log 2>&1' % \
-            (port, self.__fifo, self.__sock_path)
-        logging.info(cmd)
-        self.__async_cmd = AsyncSystemCommand(cmd)
+        # No shell in between so the process we track is indiserver itself
+        cmd = ['indiserver', '-p', str(port), '-m', '1000', '-v',
+               '-f', self.__fifo, '-u', self.__sock_path]
+        logging.info(' '.join(cmd))
+        self.__async_cmd = AsyncSystemCommand(cmd, INDI_LOG)
         # Run the command asynchronously
-        self.__command_thread = threading.Thread(target=self.__async_cmd.run)
-        self.__command_thread.start()
+        self.__async_cmd.start()
+
+    def __open_fifo(self):
+        # Opening the write end fails with ENXIO until indiserver opened
+        # the read end, so retry for a while right after launching it.
+        deadline = time.monotonic() + INDI_FIFO_TIMEOUT
+        while True:
+            try:
+                fd = os.open(self.__fifo, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError as e:
+                if e.errno != errno.ENXIO or time.monotonic() > deadline:
+                    raise
+                # Nobody will ever open the read end if indiserver is gone
+                if not self.is_running():
+                    raise OSError(errno.ENXIO, 'indiserver exited before opening %s' % self.__fifo)
+                time.sleep(0.05)
+            else:
+                os.set_blocking(fd, True)
+                return fd
+
+    def __close_fifo(self):
+        if self.__fifo_fd is not None:
+            os.close(self.__fifo_fd)
+            self.__fifo_fd = None
+
+    def __write_fifo(self, lines):
+        # Write straight to the FIFO, no shell involved so no escaping needed
+        for line in lines:
+            logging.info(line)
+        if self.__fifo_fd is None:
+            self.__fifo_fd = self.__open_fifo()
+        try:
+            os.write(self.__fifo_fd, ('\n'.join(lines) + '\n').encode('utf_8'))
+        except BrokenPipeError:
+            # indiserver went away, reopen on the next write
+            self.__close_fifo()
+            raise
 
-    def start_driver(self, driver):
-        # escape quotes if they exist
-        cmd = 'start %s' % driver.binary
+    def __start_command(self, driver):
+        cmd = f'start {driver.binary}'
 
         if driver.skeleton:
-            cmd += ' -s "%s"' % driver.skeleton
+            cmd += f' -s "{driver.skeleton}"'
 
-        cmd += ' -n "%s"' % driver.label
-        cmd = cmd.replace('"', '\\"')
-        full_cmd = 'echo "%s" > %s' % (cmd, self.__fifo)
-        logging.info(full_cmd)
-        call(full_cmd, shell=True)
+        cmd += f' -n "{driver.label}"'
+        return cmd
+
+    def start_driver(self, driver):
+        self.__write_fifo([self.__start_command(driver)])
         self.__running_drivers[driver.label] = driver
 
     def stop_driver(self, driver):
-        # escape quotes if they exist
-        cmd = 'stop %s' % driver.binary
+        cmd = f'stop {driver.binary}'
 
 #        if "@" not in driver.binary:
-        cmd += ' -n "%s"' % driver.label
+        cmd += f' -n "{driver.label}"'
 
-        cmd = cmd.replace('"', '\\"')
-        full_cmd = 'echo "%s" > %s' % (cmd, self.__fifo)
-        logging.info(full_cmd)
-        call(full_cmd, shell=True)
+        self.__write_fifo([cmd])
         del self.__running_drivers[driver.label]
 
     def start(self, port=INDI_PORT, drivers=[]):
         if self.is_running():
             self.stop()
 
+        # Reopen the FIFO once the new indiserver is reading it
+        self.__close_fifo()
         self.__clear_fifo()
         self.__run(port)
         self.__running_drivers = {}
 
+        # Send all start commands in a single write
+        if drivers:
+            self.__write_fifo([self.__start_command(driver) for driver in drivers])
         for driver in drivers:
-            self.start_driver(driver)
+            self.__running_drivers[driver.label] = driver
 
     def stop(self):
         # Terminate will also kill the child processes like the drivers
         try:
             self.__async_cmd.terminate()
-            self.__command_thread.join()
+            self.__close_fifo()
         except Exception as e:
-            logging.warn('indi_server: termination failed with error ' + str(e))
+            logging.warning('indi_server: termination failed with error %s', e)
         else:
             logging.info('indi_server: terminated successfully')
 
@@ -91,12 +135,11 @@ class IndiServer(object):
             return False
 
     def set_prop(self, dev, prop, element, value):
-        cmd = ['indi_setprop', '%s.%s.%s=%s' % (dev, prop, element, value)]
-        call(cmd)
+        call(('indi_setprop', f'{dev}.{prop}.{element}={value}'))
 
     def get_prop(self, dev, prop, element):
         cmd = ['indi_getprop', '%s.%s.%s' % (dev, prop, element)]
-        output = check_output(cmd)
+        output = check_output(cmd).decode('utf_8')
         return output.split('=')[1].strip()
 
     def get_state(self, dev, prop):
@@ -110,12 +153,20 @@ class IndiServer(object):
         except Exception as e:
             logging.error(e)
 
-        output = output.replace("Off", "On")
-
-        for dev in output.splitlines():
-            command = ['indi_setprop', dev]
-            logging.info(command)
-            call(command)
+        # Only touch the value of devices that are still disconnected
+        devices = [line[:-3] + 'On' for line in output.splitlines()
+                   if line.endswith('=Off')]
+        if not devices:
+            return
+
+        # Connect all devices with a single indi_setprop call
+        command = ['indi_setprop'] + devices
+        logging.info(command)
+        if call(command) != 0 and len(devices) > 1:
+            for dev in devices:
+                command = ['indi_setprop', dev]
+                logging.info(command)
+                call(command)
 
     def get_running_drivers(self):
         drivers = self.__running_drivers
@@ -1,18 +1,16 @@
 #!/usr/bin/python
 import logging
 import os
-import threading
 
 # local
 from .AsyncSystemCommand import AsyncSystemCommand
 
 INDIHUB_AGENT_OFF = 'off'
 INDIHUB_AGENT_DEFAULT_MODE = 'solo'
+INDIHUB_AGENT_LOG = '/tmp/indihub-agent.log'
 
-try:
-    INDIHUB_AGENT_CONFIG = os.path.join(os.environ['HOME'], '.indihub')
-except KeyError:
-    INDIHUB_AGENT_CONFIG = '/tmp/indihub'
+_home = os.environ.get('HOME')
+INDIHUB_AGENT_CONFIG = os.path.join(_home, '.indihub') if _home else '/tmp/indihub'
 
 if not os.path.exists(INDIHUB_AGENT_CONFIG):
     os.makedirs(INDIHUB_AGENT_CONFIG)
@@ -28,15 +26,16 @@ class IndiHubAgent(object):
         self.__async_cmd = None
 
     def __run(self, profile, mode, conf):
-        cmd = 'indihub-agent -indi-server-manager=%s -indi-profile=%s -mode=%s -conf=%s -api-origins=%s > ' \
-              '/tmp/indihub-agent.log 2>&1 &' % \
-              (self.__web_addr, profile, mode, conf,
-               '%s:%d,%s.local:%d' % (self.__hostname, self.__port, self.__hostname, self.__port))
+        cmd = ['indihub-agent',
+               f'-indi-server-manager={self.__web_addr}',
+               f'-indi-profile={profile}',
+               f'-mode={mode}',
+               f'-conf={conf}',
+               f'-api-origins={self.__hostname}:{self.__port},{self.__hostname}.local:{self.__port}']
         logging.info(cmd)
-        self.__async_cmd = AsyncSystemCommand(cmd)
+        self.__async_cmd = AsyncSystemCommand(cmd, INDIHUB_AGENT_LOG)
         # Run the command asynchronously
-        self.__command_thread = threading.Thread(target=self.__async_cmd.run)
-        self.__command_thread.start()
+        self.__async_cmd.start()
 
     def start(self, profile, mode=INDIHUB_AGENT_DEFAULT_MODE, conf=INDIHUB_AGENT_CONFIG):
         if self.is_running():
@@ -51,9 +50,8 @@ class IndiHubAgent(object):
             return
         try:
             self.__async_cmd.terminate()
-            self.__command_thread.join()
         except Exception as e:
-            logging.warn('indihub_agent: termination failed with error ' + str(e))
+            logging.warning('indihub_agent: termination failed with error %s', e)
         else:
             logging.info('indihub_agent: terminated successfully')
 
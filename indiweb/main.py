@@ -2,18 +2,20 @@
 
 import os
 import json
+import gzip
+import hashlib
 import logging
 import argparse
 import socket
-from threading import Timer
+from threading import Lock, Timer
 import subprocess
 import platform
-from importlib_metadata import version
+from functools import lru_cache
 
 from bottle import (
     Bottle,
     run,
-    template,
+    SimpleTemplate,
     TEMPLATE_PATH,
     static_file,
     request,
@@ -27,16 +29,40 @@ from .database import Database
 from .device import Device
 from .indihub_agent import IndiHubAgent
 
+# Use orjson for the API responses if it is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj):
+    if orjson:
+        return orjson.dumps(obj)
+    return json.dumps(obj)
+
+
+def send_json(obj):
+    """Serialize obj as the JSON body of the current response"""
+    response.content_type = 'application/json'
+    return dumps(obj)
+
+
 # default settings
 WEB_HOST = '0.0.0.0'
 WEB_PORT = 8624
 
+# Compress cached JSON responses larger than this
+GZIP_MIN_SIZE = 1024
+
 # Make it 10MB
 BaseRequest.MEMFILE_MAX = 50 * 1024 * 1024
 
 pkg_path, _ = os.path.split(os.path.abspath(__file__))
 views_path = os.path.join(pkg_path, 'views')
 TEMPLATE_PATH.insert(0, views_path)
+# Main page template, looked up once instead of on every request
+form_template = SimpleTemplate(name='form.tpl', lookup=[views_path])
 
 parser = argparse.ArgumentParser(
     description='INDI Web Manager. '
@@ -80,10 +106,14 @@ else:
     logging.basicConfig(format='%(asctime)s - %(levelname)s: %(message)s',
                         level=logging_level)
 
-logging.debug("command line arguments: " + str(vars(args)))
+logging.debug("command line arguments: %s", vars(args))
 
 hostname = socket.gethostname()
 
+# Machine architecture, named as in the Debian package repositories
+machine = platform.machine()
+arch = {'aarch64': 'arm64', 'armv7l': 'armhf'}.get(machine, machine)
+
 collection = DriverCollection(args.xmldir)
 indi_server = IndiServer(args.fifo, args.conf)
 indi_device = Device()
@@ -105,27 +135,102 @@ else:
 saved_profile = None
 active_profile = ""
 
+# Serialized driver catalog, cleared whenever custom drivers change
+driver_cache = {}
+# Rendered main page per selected profile, cleared whenever profiles
+# or the driver collection change
+form_cache = {}
+# Held while filling or clearing form_cache so a render that started
+# before a write cannot store a stale page after the write cleared it
+form_lock = Lock()
+# Serialized running drivers, cleared whenever drivers start or stop
+running_cache = {}
+# Pending delayed auto connect, at most one at a time
+autoconnect_timer = None
+
+
+def clear_form_cache():
+    """Drop the rendered main pages after a profile or driver change"""
+    with form_lock:
+        form_cache.clear()
+
+
+def cache_entry(obj):
+    """Serialize obj once and return it with its ETag and gzipped copy"""
+    body = dumps(obj)
+    data = body if isinstance(body, bytes) else body.encode('utf-8')
+    # Small payloads are not worth compressing
+    gzipped = gzip.compress(data) if len(data) > GZIP_MIN_SIZE else None
+    return body, '"%s"' % hashlib.sha1(data).hexdigest(), gzipped
+
+
+def accepts_gzip():
+    """Whether the client accepts a gzip encoded response"""
+    qvalues = {}
+    for coding in request.get_header('Accept-Encoding', '').split(','):
+        name, _, params = coding.partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues[name.strip().lower()] = q
+    # An explicit gzip entry wins over the wildcard
+    return qvalues.get('gzip', qvalues.get('*', 0)) > 0
+
+
+def send_cached(body, etag, gzipped=None):
+    """Send a cached JSON body, or 304 if the client already has it"""
+    response.content_type = 'application/json'
+    # Clients may keep a copy but must revalidate it
+    response.set_header('Cache-Control', 'no-cache')
+    if gzipped is not None:
+        response.set_header('Vary', 'Accept-Encoding')
+        if accepts_gzip():
+            body = gzipped
+            etag = etag[:-1] + '-gzip"'
+            response.set_header('Content-Encoding', 'gzip')
+    response.set_header('ETag', etag)
+    if request.get_header('If-None-Match') == etag:
+        response.status = 304
+        return ''
+    return body
+
+
+def cancel_autoconnect():
+    """Cancel a delayed auto connect that has not fired yet"""
+    global autoconnect_timer
+    if autoconnect_timer:
+        autoconnect_timer.cancel()
+        autoconnect_timer = None
+
 
 def start_profile(profile):
+    global autoconnect_timer
     info = db.get_profile(profile)
 
-    profile_drivers = db.get_profile_drivers_labels(profile)
-    all_drivers = [collection.by_label(d['label']) for d in profile_drivers]
+    labels, remote_drivers = db.get_profile_all_drivers(profile)
+    all_drivers = [collection.by_label(label) for label in labels]
 
     # Find if we have any remote drivers
-    remote_drivers = db.get_profile_remote_drivers(profile)
     if remote_drivers:
-        drivers = remote_drivers['drivers'].split(',')
+        drivers = remote_drivers.split(',')
         for drv in drivers:
-            logging.warning(f"LOADING REMOTE DRIVER drv is {drv}")
+            logging.warning("LOADING REMOTE DRIVER drv is %s", drv)
             all_drivers.append(DeviceDriver(drv, drv, "1.0", drv, "Remote"))
 
     if all_drivers:
+        # An auto connect still pending belongs to the server being replaced
+        cancel_autoconnect()
         indi_server.start(info['port'], all_drivers)
+        running_cache.clear()
         # Auto connect drivers in 3 seconds if required.
         if info['autoconnect'] == 1:
-            t = Timer(3, indi_server.auto_connect)
-            t.start()
+            autoconnect_timer = Timer(3, indi_server.auto_connect)
+            autoconnect_timer.start()
 
 
 @app.route('/static/<path:path>')
@@ -134,29 +239,41 @@ def callback(path):
     return static_file(path, root=views_path)
 
 
+@lru_cache(maxsize=1)
+def favicon_data():
+    """Favicon contents, read from disk once"""
+    with open(os.path.join(views_path, 'favicon.ico'), 'rb') as f:
+        return f.read()
+
+
 @app.route('/favicon.ico', method='GET')
 def get_favicon():
     """Serve favicon"""
-    return static_file('favicon.ico', root=views_path)
+    response.content_type = 'image/x-icon'
+    response.set_header('Cache-Control', 'public, max-age=86400')
+    return favicon_data()
 
 
 @app.route('/')
 def main_form():
     """Main page"""
     global saved_profile
-    drivers = collection.get_families()
-
     if not saved_profile:
         saved_profile = request.get_cookie('indiserver_profile') or 'Simulators'
-
-    profiles = db.get_profiles()
-    return template(
-        "form.tpl",
-        profiles=profiles,
-        drivers=drivers,
-        saved_profile=saved_profile,
-        hostname=hostname,
-    )
+    profile = saved_profile
+
+    with form_lock:
+        if profile not in form_cache:
+            # Families sorted by name, kept until the driver collection changes
+            if 'families' not in driver_cache:
+                driver_cache['families'] = sorted(collection.get_families().items())
+            form_cache[profile] = form_template.render(
+                profiles=db.get_profiles(),
+                drivers=driver_cache['families'],
+                saved_profile=profile,
+                hostname=hostname,
+            )
+        return form_cache[profile]
 
 ###############################################################################
 # Profile endpoints
@@ -167,26 +284,28 @@ def main_form():
 def get_json_profiles():
     """Get all profiles (JSON)"""
     results = db.get_profiles()
-    return json.dumps(results)
+    return send_json(results)
 
 
 @app.get('/api/profiles/<item>')
 def get_json_profile(item):
     """Get one profile info"""
     results = db.get_profile(item)
-    return json.dumps(results)
+    return send_json(results)
 
 
 @app.post('/api/profiles/<name>')
 def add_profile(name):
     """Add new profile"""
     db.add_profile(name)
+    clear_form_cache()
 
 
 @app.delete('/api/profiles/<name>')
 def delete_profile(name):
     """Delete Profile"""
     db.delete_profile(name)
+    clear_form_cache()
 
 
 @app.put('/api/profiles/<name>')
@@ -199,6 +318,7 @@ def update_profile(name):
     autostart = bool(data.get('autostart', 0))
     autoconnect = bool(data.get('autoconnect', 0))
     db.update_profile(name, port, autostart, autoconnect)
+    clear_form_cache()
 
 
 @app.post('/api/profiles/<name>/drivers')
@@ -206,6 +326,7 @@ def save_profile_drivers(name):
     """Add drivers to existing profile"""
     data = request.json
     db.save_profile_drivers(name, data)
+    clear_form_cache()
 
 
 @app.post('/api/profiles/custom')
@@ -215,13 +336,15 @@ def save_profile_custom_driver():
     db.save_profile_custom_driver(data)
     collection.clear_custom_drivers()
     collection.parse_custom_drivers(db.get_custom_drivers())
+    driver_cache.clear()
+    clear_form_cache()
 
 
 @app.get('/api/profiles/<item>/labels')
 def get_json_profile_labels(item):
     """Get driver labels of specific profile"""
     results = db.get_profile_drivers_labels(item)
-    return json.dumps(results)
+    return send_json(results)
 
 
 @app.get('/api/profiles/<item>/remote')
@@ -230,7 +353,7 @@ def get_remote_drivers(item):
     results = db.get_profile_remote_drivers(item)
     if results is None:
         results = {}
-    return json.dumps(results)
+    return send_json(results)
 
 
 ###############################################################################
@@ -240,8 +363,11 @@ def get_remote_drivers(item):
 @app.get('/api/server/status')
 def get_server_status():
     """Server status"""
-    status = [{'status': str(indi_server.is_running()), 'active_profile': active_profile}]
-    return json.dumps(status)
+    # Polled constantly and always the same shape, so fill in a fixed layout.
+    # Only the profile name needs escaping.
+    response.content_type = 'application/json'
+    return '[{"status": "%s", "active_profile": %s}]' % \
+        (indi_server.is_running(), json.dumps(active_profile))
 
 
 @app.get('/api/server/drivers')
@@ -255,11 +381,13 @@ def get_server_drivers():
     # for label in sorted(indi_server.get_running_drivers().keys()):
     #     labels.append({'driver': label})
     # return json.dumps(labels)
-    drivers = []
-    if indi_server.is_running() is True:
-        for driver in indi_server.get_running_drivers().values():
-            drivers.append(driver.__dict__)
-    return json.dumps(drivers)
+    if indi_server.is_running() is not True:
+        return send_json([])
+    if 'drivers' not in running_cache:
+        drivers = [driver.__dict__ for driver in indi_server.get_running_drivers().values()]
+        running_cache['drivers'] = dumps(drivers)
+    response.content_type = 'application/json'
+    return running_cache['drivers']
 
 
 @app.post('/api/server/start/<profile>')
@@ -277,8 +405,10 @@ def start_server(profile):
 @app.post('/api/server/stop')
 def stop_server():
     """Stop INDI Server"""
+    cancel_autoconnect()
     indihub_agent.stop()
     indi_server.stop()
+    running_cache.clear()
 
     global active_profile
     active_profile = ""
@@ -293,25 +423,32 @@ def stop_server():
 # Info endpoints
 ###############################################################################
 
+@lru_cache(maxsize=1)
+def version_body():
+    """Serialized installed package version, looked up once"""
+    # Only this endpoint needs the metadata machinery, import it here
+    from importlib_metadata import version
+    return dumps({"version": version("indiweb")})
+
+
 @app.get('/api/info/version')
-def get_version():    
-    return {"version": version("indiweb")}
+def get_version():
+    response.set_header('Cache-Control', 'public, max-age=60')
+    response.content_type = 'application/json'
+    return version_body()
 
 
 # Get StellarMate Architecture
 @app.get('/api/info/arch')
 def get_arch():
-    arch = platform.machine()
-    if arch == "aarch64":
-        arch = "arm64"
-    elif arch == "armv7l":
-        arch = "armhf"
+    response.set_header('Cache-Control', 'public, max-age=86400')
     return arch
 
 # Get Hostname
 @app.get('/api/info/hostname')
 def get_hostname():
-    return {"hostname": socket.gethostname()}
+    response.set_header('Cache-Control', 'public, max-age=60')
+    return send_json({"hostname": hostname})
     
 ###############################################################################
 # Driver endpoints
@@ -320,54 +457,50 @@ def get_hostname():
 @app.get('/api/drivers/groups')
 def get_json_groups():
     """Get all driver families (JSON)"""
-    response.content_type = 'application/json'
-    families = collection.get_families()
-    return json.dumps(sorted(families.keys()))
+    if 'groups' not in driver_cache:
+        families = collection.get_families()
+        driver_cache['groups'] = cache_entry(sorted(families.keys()))
+    return send_cached(*driver_cache['groups'])
 
 
 @app.get('/api/drivers')
 def get_json_drivers():
     """Get all drivers (JSON)"""
-    response.content_type = 'application/json'
-    return json.dumps([ob.__dict__ for ob in collection.drivers])
+    if 'drivers' not in driver_cache:
+        driver_cache['drivers'] = cache_entry([ob.__dict__ for ob in collection.drivers])
+    return send_cached(*driver_cache['drivers'])
 
 
-@app.post('/api/drivers/start/<label>')
-def start_driver(label):
-    """Start INDI driver"""
-    driver = collection.by_label(label)
+def restart_driver(driver):
+    indi_server.stop_driver(driver)
     indi_server.start_driver(driver)
-    logging.info('Driver "%s" started.' % label)
 
-@app.post('/api/drivers/start_remote/<label>')
-def start_remote_driver(label):
-    """Start INDI driver"""
-    driver = DeviceDriver(label, label, "1.0", label, "Remote")
-    indi_server.start_driver(driver)
-    logging.info('Driver "%s" started.' % label)
 
-@app.post('/api/drivers/stop/<label>')
-def stop_driver(label):
-    """Stop INDI driver"""
-    driver = collection.by_label(label)
-    indi_server.stop_driver(driver)
-    logging.info('Driver "%s" stopped.' % label)
+# Driver operations by URL action, with the word used when logging them
+DRIVER_ACTIONS = {
+    'start': (indi_server.start_driver, 'started'),
+    'stop': (indi_server.stop_driver, 'stopped'),
+    'restart': (restart_driver, 'restarted'),
+}
 
-@app.post('/api/drivers/stop_remote/<label>')
-def stop_remote_driver(label):
-    """Stop INDI driver"""
-    driver = DeviceDriver(label, label, "1.0", label, "Remote")
-    indi_server.stop_driver(driver)
-    logging.info('Driver "%s" stopped.' % label)
 
+def run_driver_action(action, driver):
+    operation, done = DRIVER_ACTIONS[action]
+    operation(driver)
+    running_cache.clear()
+    logging.info('Driver "%s" %s.', driver.label, done)
 
-@app.post('/api/drivers/restart/<label>')
-def restart_driver(label):
-    """Restart INDI driver"""
-    driver = collection.by_label(label)
-    indi_server.stop_driver(driver)
-    indi_server.start_driver(driver)
-    logging.info('Driver "%s" restarted.' % label)
+
+@app.post('/api/drivers/<action:re:start|stop|restart>/<label>')
+def driver_action(action, label):
+    """Start, stop or restart INDI driver"""
+    run_driver_action(action, collection.by_label(label))
+
+
+@app.post('/api/drivers/<action:re:start|stop>_remote/<label>')
+def remote_driver_action(action, label):
+    """Start or stop remote INDI driver"""
+    run_driver_action(action, DeviceDriver(label, label, "1.0", label, "Remote"))
 
 ###############################################################################
 # Device endpoints
@@ -376,7 +509,7 @@ def restart_driver(label):
 
 @app.get('/api/devices')
 def get_devices():
-    return json.dumps(indi_device.get_devices())
+    return send_json(indi_device.get_devices())
 
 ###############################################################################
 # System control endpoints
@@ -389,7 +522,9 @@ def system_reboot():
     logging.info('System reboot, stopping server...')
     stop_server()
     logging.info('rebooting...')
-    subprocess.run(["sudo", "reboot"] if args.sudo else "reboot")
+    # Do not wait for the command so the response can still be sent
+    subprocess.Popen(["sudo", "reboot"] if args.sudo else ["reboot"],
+                     start_new_session=True)
 
 
 @app.post('/api/system/poweroff')
@@ -398,7 +533,9 @@ def system_poweroff():
     logging.info('System poweroff, stopping server...')
     stop_server()
     logging.info('poweroff...')
-    subprocess.run(["sudo", "poweroff"] if args.sudo else "poweroff")
+    # Do not wait for the command so the response can still be sent
+    subprocess.Popen(["sudo", "poweroff"] if args.sudo else ["poweroff"],
+                     start_new_session=True)
 
 ###############################################################################
 # INDIHUB Agent control endpoints
@@ -410,9 +547,8 @@ def get_indihub_status():
     """INDIHUB Agent status"""
     mode = indihub_agent.get_mode()
     is_running = indihub_agent.is_running()
-    response.content_type = 'application/json'
     status = [{'status': str(is_running), 'mode': mode, 'active_profile': active_profile}]
-    return json.dumps(status)
+    return send_json(status)
 
 
 @app.post('/api/indihub/mode/<mode>')
@@ -420,9 +556,8 @@ def change_indihub_agent_mode(mode):
     """Change INDIHUB Agent mode with a current INDI-profile"""
 
     if active_profile == "" or not indi_server.is_running():
-        response.content_type = 'application/json'
         response.status = 500
-        return json.dumps({'message': 'INDI-server is not running. You need to run INDI-server first.'})
+        return send_json({'message': 'INDI-server is not running. You need to run INDI-server first.'})
 
     if indihub_agent.is_running():
         indihub_agent.stop()
@@ -442,17 +577,20 @@ def main():
     """Start autostart profile if any"""
     global active_profile
 
-    for profile in db.get_profiles():
-        if profile['autostart']:
+    profile = db.get_autostart_profile()
+    if profile:
+        try:
             start_profile(profile['name'])
             active_profile = profile['name']
-            break
+        except Exception as e:
+            # Keep serving so the profile can be fixed from the web page
+            logging.error('Failed to start profile %s: %s', profile['name'], e)
 
-    run(app, host=args.host, port=args.port, quiet=args.verbose)
+    run(app, host=args.host, port=args.port, quiet=not args.verbose)
     logging.info("Exiting")
 
 
 # JM 2018-12-24: Added __main__ so I can debug this as a module in PyCharm
 # Otherwise, I couldn't get it to run main as all
-if __name__ == '__init__' or __name__ == '__main__':
+if __name__ == '__main__':
     main()
@@ -71,7 +71,7 @@
      <div class="form-group">
      <label for="drivers" class="control-label">Drivers:</label>
        <select id="drivers_list" class="form-control selectpicker show-tick" data-live-search="true" title="Select drivers..." data-selected-text-format="count > 5" multiple>
-%for family,driver_list in sorted(drivers.items()):
+%for family,driver_list in drivers:
        <optgroup label="{{family}}">
       %for driver in driver_list:
         <option value="{{driver}}" data-tokens="{{driver}}">{{driver}}</option>